@@ -6,14 +6,17 @@ if __name__ == '__main__':
 import acq4.util.ptime as ptime
 from ctypes import *
 from acq4.util.clibrary import *
-from numpy import empty, uint16, ascontiguousarray, concatenate, newaxis
+from numpy import empty, uint16
 from acq4.pyqtgraph import graphicsWindows as gw
 from PyQt4 import QtGui
 from acq4.util.Mutex import Mutex
-from collections import OrderedDict
+from collections import OrderedDict, deque
 import atexit
 import traceback
 import time
+import logging
+log = logging.getLogger(__name__)
+log.addHandler(logging.NullHandler())
 modDir = os.path.dirname(__file__)
 sdkDir = r"C:\Program Files\QImaging\SDK\Headers"
 
@@ -22,7 +25,7 @@ if os.path.isdir(sdkDir):
     headerDir = sdkDir
 else:
     headerDir = modDir
-print headerDir
+log.debug('QCam header directory: %s', headerDir)
 p = CParser(os.path.join(headerDir, "QCamApi.h"), cache=os.path.join(modDir, 'QCamApi.h.cache'), macros={'_WIN32': '', '__int64': ('long long')})
 
 if sys.platform == 'darwin':
@@ -75,6 +78,72 @@ cameraDefaults = {
         'qprmImageFormat':'qfmtMono16',
     }}
 
+## Some parameters can be accessed as groups
+groupParams = {
+    #'binning':['binningX', 'binningY']
+    'region': ['regionX', 'regionY', 'regionW', 'regionH'],
+    'sensorSize': ['qinfCcdWidth', 'qinfCcdHeight'] 
+}
+
+paramEnums = {
+    'qprmImageFormat': 'QCam_ImageFormat',
+    #'qprmPostProcessImageFormat': 'QCam_ImageFormat',
+    'qprmSyncb': 'QCam_qcSyncb',
+    'qprmReadoutSpeed': 'QCam_qcReadoutSpeed',
+    #'qprmColorWheel': 'QCam_qcWheelColor',
+    'qprmTriggerType': 'QCam_qcTriggerType'
+}
+
+## translates public parameter names to QCam parameter names
+userToCameraDict = {
+    'triggerMode':'qprmTriggerType',
+    'exposure':'qprm64Exposure',
+    'binning':'qprmBinning',
+    'binningX':'qprmBinning',
+    'binningY':'qprmBinning',
+    'regionX':'qprmRoiX',
+    'regionY':'qprmRoiY',
+    'regionW':'qprmRoiWidth',
+    'regionH':'qprmRoiHeight',
+    'gain':'qprmNormalizedGain',
+    'Normal':'qcTriggerFreerun',
+    'Strobe':'qcTriggerEdgeHi',
+    'Bulb':'qcTriggerPulseHi',
+    'bitDepth':'qinfBitDepth'
+}
+
+cameraToUserDict = {
+    'qprmTriggerType':'triggerMode',
+    'qprm64Exposure':'exposure',
+    'qprmBinning':'binningX',
+    'qprmRoiX':'regionX',
+    'qprmRoiY':'regionY',
+    'qprmRoiWidth':'regionW',
+    'qprmRoiHeight':'regionH',
+    'qprmNormalizedGain':'gain',
+    'qcTriggerFreerun':'Normal',
+    #'qcTriggerNone':'Normal',
+    'qcTriggerEdgeHi':'Strobe',
+    'qcTriggerPulseHi':'Bulb',
+    'qinfBitDepth':'bitDepth',
+    'qcSyncbOem2': 'qcSyncbExpose',
+    'qcSyncbOem1': 'qcSyncbTrigmask'
+}
+## parameters whose values are scaled by binning (see _readParamFromSettings)
+regionParams = set(['region', 'regionX', 'regionY', 'regionW', 'regionH',
+                    'qprmRoiX', 'qprmRoiY', 'qprmRoiWidth', 'qprmRoiHeight'])
+unitConversionDict = {
+    'gain': 1e-6,     #QCam expects microunits
+    'exposure': 1e-9  #QCam expresses exposure in nanoseconds
+    }
+## inverse factors, written out rather than computed so that int() of the
+## converted values is not thrown off by rounding in 1/x
+unitConversionInvDict = {
+    'gain': 1e6,
+    'exposure': 1e9
+    }
+
+
 #def init():
 #    ## System-specific code
 #    global QCam
@@ -102,16 +171,18 @@ class QCamDriverClass:
     def call(self, function, *args):
         """"""
         a = function(*args)
-        if a() == None:
+        err = a()
+        if err == None:
             return a
-        elif a() != 0:
-            for x in lib('enums', 'QCam_Err'):
-                if lib('enums', 'QCam_Err')[x] == a():
-                    raise QCamFunctionError(a(), "There was an error running %s. Error code = %s" %(function.name,x))
+        elif err != 0:
+            raise QCamFunctionError(err, "There was an error running %s. Error code = %s" %(function.name, self.errNames.get(err, err)))
         else:
             return a
 
     def loadDriver(self):
+        ## error code: error name, for translating return values
+        self.errIds = lib('enums', 'QCam_Err')
+        self.errNames = dict([(v, k) for k, v in self.errIds.items()])
         self.call(lib.LoadDriver)
  
     #def releaseDriver(self):
@@ -122,9 +193,7 @@ class QCamDriverClass:
         L = lib.CamListItem * 10
         l = L()
         self.call(lib.ListCameras, l, number)
-        cams = {}
-        for x in list(l)[:number.value]:
-            cams[x.uniqueId] = x.cameraId
+        cams = dict([(l[i].uniqueId, l[i].cameraId) for i in range(number.value)])
         return cams
     
     def getCamera(self, cam):
@@ -159,78 +228,86 @@ class QCameraClass:
         #print "QCamera Class: setting self variables..."
         self.name = name
         self.driver = driver
+        self.errNames = driver.errNames
+        self.errNotSupported = driver.errIds['qerrNotSupported']
         self.isOpen = False
         self.handle = self.open()
         self.ringSize = 10
         self.paramAttrs = OrderedDict()
+        self.paramAttrsValid = False  ## False forces listParams to re-query the camera
+        self.paramAttrsAll = False
+        ## parameters whose values change the allowed ranges of other parameters
+        self.paramAttrsDeps = ['binningX', 'regionX', 'regionY', 'regionW', 'regionH', 
+                               'triggerMode', 'qprmReadoutSpeed', 'qprmImageFormat']
         self.cameraInfo = {}
-        self.frames = []
-        self.arrays = []
-        self.frameTimes = []
+        ## per-acquisition state; allocated in start() and released in stop()
+        self.frames = None
+        self.arrays = None
+        self._frameArgs = None
+        self.frameTimes = None
+        self.ringBuffer = None  ## kept between acquisitions; see allocRing
+        self._frameGeometry = None  ## see frameGeometry
         self.i = 0
         self.stopSignal = True
+        self._paramShadow = {}  ## last known value of each parameter; see setParams
+        
+        ## don't let CLib create settings struct for us--we need to initialize the 'size' field before it can be used.
+        ## ALSO! It looks like some versions of the QImaging driver have a bug, so we need to allocate 2 adjacent 
+        ## structures; the second one is a junk buffer for the driver to barf in.
+        self._settings = (lib.QCam_Settings*2)()
+        self._settings[0].size = sizeof(self._settings[0])
+        self._settingsValid = False  ## cleared whenever the camera's settings may differ from the cached copy
         self.mutex = Mutex(Mutex.Recursive)
         self.lastImage = (None,0)
+        self.lastImages = deque()  ## filled by callBack1, drained by newFrames
         self.fnp1 = lib.AsyncCallback(self.callBack1)
+        ## looked up once; QueueFrame is called for every frame from callBack1
+        self._queueFrame = lib.QueueFrame
+        self._queueFlags = lib.qcCallbackDone|lib.qcCallbackExposeDone
         self.fnpNull = lib.AsyncCallback(self.doNothing)
         self.counter = 0
         
         
-        ## Some parameters can be accessed as groups
-        self.groupParams = {
-            #'binning':['binningX', 'binningY']
-            'region': ['regionX', 'regionY', 'regionW', 'regionH'],
-            'sensorSize': ['qinfCcdWidth', 'qinfCcdHeight'] 
-        }
-
-        self.paramEnums = {
-            'qprmImageFormat': 'QCam_ImageFormat',
-            #'qprmPostProcessImageFormat': 'QCam_ImageFormat',
-            'qprmSyncb': 'QCam_qcSyncb',
-            'qprmReadoutSpeed': 'QCam_qcReadoutSpeed',
-            #'qprmColorWheel': 'QCam_qcWheelColor',
-            'qprmTriggerType': 'QCam_qcTriggerType'
-        }
-        
-        ## translates public parameter names to QCam parameter names
-        self.userToCameraDict = {
-            'triggerMode':'qprmTriggerType',
-            'exposure':'qprm64Exposure',
-            'binning':'qprmBinning',
-            'binningX':'qprmBinning',
-            'binningY':'qprmBinning',
-            'regionX':'qprmRoiX',
-            'regionY':'qprmRoiY',
-            'regionW':'qprmRoiWidth',
-            'regionH':'qprmRoiHeight',
-            'gain':'qprmNormalizedGain',
-            'Normal':'qcTriggerFreerun',
-            'Strobe':'qcTriggerEdgeHi',
-            'Bulb':'qcTriggerPulseHi',
-            'bitDepth':'qinfBitDepth'
-        }
-        
-        self.cameraToUserDict = {
-            'qprmTriggerType':'triggerMode',
-            'qprm64Exposure':'exposure',
-            'qprmBinning':'binningX',
-            'qprmRoiX':'regionX',
-            'qprmRoiY':'regionY',
-            'qprmRoiWidth':'regionW',
-            'qprmRoiHeight':'regionH',
-            'qprmNormalizedGain':'gain',
-            'qcTriggerFreerun':'Normal',
-            #'qcTriggerNone':'Normal',
-            'qcTriggerEdgeHi':'Strobe',
-            'qcTriggerPulseHi':'Bulb',
-            'qinfBitDepth':'bitDepth',
-            'qcSyncbOem2': 'qcSyncbExpose',
-            'qcSyncbOem1': 'qcSyncbTrigmask'
-        }
-        self.unitConversionDict = {
-            'gain': 1e-6,     #QCam expects microunits
-            'exposure': 1e-9  #QCam expresses exposure in nanoseconds
-            }
+        ## These tables are shared by all camera instances (see module-level definitions).
+        self.groupParams = groupParams
+        self.paramEnums = paramEnums
+        self.userToCameraDict = userToCameraDict
+        self.cameraToUserDict = cameraToUserDict
+        self.unitConversionDict = unitConversionDict
+        
+        ## Cache enum tables from the headers; these are consulted for every
+        ## parameter in listParams, getParams, and setParams.
+        self.enumParam = lib('enums', 'QCam_Param')
+        self.enumParamS32 = lib('enums', 'QCam_ParamS32')
+        self.enumParam64 = lib('enums', 'QCam_Param64')
+        self.paramIds = {}  ## parameter name: QCam parameter id (same as getattr(lib, name))
+        for enum in [self.enumParam, self.enumParamS32, self.enumParam64]:
+            self.paramIds.update(enum)
+        self.infoIds = lib('enums', 'QCam_Info')  ## info name: QCam info id (for GetInfo)
+        self.paramEnumsCache = dict([(k, lib('enums', v)) for k, v in self.paramEnums.items()])
+        
+        ## Driver functions used to probe each parameter family in fillParamDict:
+        ## (get, get sparse table, get min, get max, table element type)
+        probeFns = [
+            (self.enumParam, (lib.GetParam, lib.GetParamSparseTable, lib.GetParamMin, lib.GetParamMax, c_ulong)),
+            (self.enumParamS32, (lib.GetParamS32, lib.GetParamSparseTableS32, lib.GetParamS32Min, lib.GetParamS32Max, c_long)),
+            (self.enumParam64, (lib.GetParam64, lib.GetParamSparseTable64, lib.GetParam64Min, lib.GetParam64Max, c_ulonglong)),
+        ]
+        self.paramProbeFns = {}  ## parameter name: probe functions for its family
+        for enum, fns in probeFns:
+            for name in enum:
+                self.paramProbeFns[name] = fns
+        
+        ## Reverse lookup for enum parameters: {param: {value: [names]}}. Some values
+        ## have several names (eg. qcTriggerNone and qcTriggerFreerun); names that 
+        ## have a user-facing translation are listed first.
+        self.paramEnumsInv = {}
+        for param, enumDict in self.paramEnumsCache.items():
+            inv = {}
+            for name in sorted(enumDict, key=lambda n: n not in cameraToUserDict):
+                inv.setdefault(enumDict[name], []).append(name)
+            self.paramEnumsInv[param] = inv
+        
         #print "      variables set. About to run listParams()"
         
         self.listParams()
@@ -245,16 +322,29 @@ class QCameraClass:
         
     def call(self, function, *args):
         a = function(*args)
-        if a() != 0:
-            for x in lib('enums', 'QCam_Err'):
-                if lib('enums', 'QCam_Err')[x] == a():
-                    raise QCamFunctionError(a(), "There was an error running %s. Error code = %s" %(function.name, x))
+        err = a()
+        if err != 0:
+            raise QCamFunctionError(err, "There was an error running %s. Error code = %s" %(function.name, self.errNames.get(err, err)))
         else:
             return a
 
+    def callIfSupported(self, function, *args):
+        """Like call(), but returns None if the camera reports the function is not supported."""
+        a = function(*args)
+        err = a()
+        if err == self.errNotSupported:
+            return None
+        if err != 0:
+            raise QCamFunctionError(err, "There was an error running %s. Error code = %s" %(function.name, self.errNames.get(err, err)))
+        return a
+
     def open(self): #opens the camera and returns the handle
         """Opens the chosen camera and returns the handle. Takes cameraID parameter."""
         if not self.isOpen: 
+            self._paramShadow = {}
+            self.paramAttrsValid = False
+            self._settingsValid = False
+            self._frameGeometry = None
             a = self.call(lib.OpenCamera, self.name, lib.Handle())
             self.isOpen = True
             #self.call(lib.SetStreaming, a[1], 1)
@@ -267,55 +357,56 @@ class QCameraClass:
         #print "quit() called from QCamCameraClass. self.isOpen: ", self.isOpen
         if not self.isOpen:
             return
+        self._paramShadow = {}
         self.call(lib.Abort, self.handle)
         self.call(lib.SetStreaming, self.handle, 0)
         self.call(lib.CloseCamera, self.handle)
         
     def translateToCamera(self, arg):
-        return self.userToCameraDict.get(arg, arg)
+        return userToCameraDict.get(arg, arg)
             
     def translateToUser(self, arg):
-        return self.cameraToUserDict.get(arg, arg)
+        return cameraToUserDict.get(arg, arg)
     
     def convertUnitsToCamera(self, param, value):
-        if param in self.unitConversionDict:
-            if type(value) in [int, float]:
-                return value/self.unitConversionDict[param]
-            elif type(value) == list:
-                for i in range(len(value)):
-                    value[i] = value[i]/self.unitConversionDict[param]
-                return value
-            elif type(value) == tuple:
-                return (value[0]/self.unitConversionDict[param], value[1]/self.unitConversionDict[param])
-        else: return value
+        f = unitConversionInvDict.get(param)
+        if f is None:
+            return value
+        if isinstance(value, (int, long, float)):
+            return value*f
+        elif isinstance(value, tuple):
+            return (value[0]*f, value[1]*f)
+        elif isinstance(value, list):
+            value[:] = [v*f for v in value]
+            return value
         
     def convertUnitsToAcq4(self, param, value):
-        if param in self.unitConversionDict:
-            #print "        0 convertUnits: param:", param, "value:", value
-            if type(value) in [type(1),type(1.0),type(1L)]:
-                #print "        1 convertUnits: param:", param, "value:", value*self.unitConversionDict[param]
-                return value*self.unitConversionDict[param]
-            elif type(value) == list:
-                for i in range(len(value)):
-                    value[i] = value[i]*self.unitConversionDict[param]
-                #print "        2 convertUnits: param:", param, "value:", value
-                return value
-            elif type(value) == tuple:
-                #print "        3 convertUnits: param:", param, "value:", (value[0]*self.unitConversionDict[param], value[1]*self.unitConversionDict[param])
-                return (value[0]*self.unitConversionDict[param], value[1]*self.unitConversionDict[param])  
-            else:
-                print "qcam.convertUnitsToAcq4 does not know how to convert value of type ", type(value)
-        else: 
+        f = unitConversionDict.get(param)
+        if f is None:
             #print "%s not in unitConversionDict." %param, "Value = ", value
             return value
+        #print "        0 convertUnits: param:", param, "value:", value
+        if isinstance(value, (int, long, float)):
+            return value*f
+        elif isinstance(value, tuple):
+            return (value[0]*f, value[1]*f)
+        elif isinstance(value, list):
+            value[:] = [v*f for v in value]
+            return value
+        else:
+            log.warning("qcam.convertUnitsToAcq4 does not know how to convert value of type %s", type(value))
     
         
     def readSettings(self):
-        ## don't let CLib create settings struct for us--we need to initialize the 'size' field before it can be used.
-        ## ALSO! It looks like some versions of the QImaging driver have a bug, so we need to allocate 2 adjacent 
-        ## structures; the second one is a junk buffer for the driver to barf in.
-        s = (lib.QCam_Settings*2)()
-        s[0].size = sizeof(s[0])
+        """Return the camera settings structure. This is read from the camera only when
+        the cached copy is out of date (see refreshSettings)."""
+        if not self._settingsValid:
+            return self.refreshSettings()
+        return self._settings[0]
+        
+    def refreshSettings(self):
+        """Read the settings structure from the camera into the cached copy."""
+        s = self._settings
         #print "==========\ndata before:"
         #for i in range(2):
             #print list(s[i]._private_data)
@@ -323,12 +414,16 @@ class QCameraClass:
         #print "data after:"
         #for i in range(2):
             #print list(s[i]._private_data)
+        self._settingsValid = True
         return s[0]
 
 
     
     def listParams(self, param=None, allParams=False):
         if param == None:
+            ## the table only changes when parameters that reshape it are set (see setParams)
+            if self.paramAttrsValid and allParams == self.paramAttrsAll:
+                return self.paramAttrs
             return self.fillParamDict(allParams=allParams)
         else:
             #if param in ['binningX', 'binningY']:
@@ -342,13 +437,7 @@ class QCameraClass:
         s = self.readSettings()
         #print "      settings structure read."
         if allParams:
-            p = []
-            for x in lib('enums', 'QCam_Param').keys():
-                p.append(x)
-            for x in lib('enums', 'QCam_ParamS32').keys():
-                p.append(x)
-            for x in lib('enums', 'QCam_Param64').keys():
-                p.append(x)
+            p = self.enumParam.keys() + self.enumParamS32.keys() + self.enumParam64.keys()
         else:
             p = externalParams
         #for x in lib('enums', 'QCam_Param'):
@@ -357,56 +446,9 @@ class QCameraClass:
                 self.paramAttrs[x] = [(2,100), True, True, []]
                 continue
             x = self.translateToCamera(x)
-            if x not in ['qprmS32AbsoluteOffset', 'qprmS32RegulatedCoolingTemp', 'qprm64Exposure']:
-                try:
-                    if self.call(lib.GetParam, byref(s), getattr(lib, x))() == 0:
-                        try: ###first try to get a SparseTable
-                            table = (c_ulong *32)()
-                            r = self.call(lib.GetParamSparseTable, byref(s), getattr(lib,x), table, c_long(32))
-                            self.paramAttrs[self.translateToUser(x)] = [list(r[2])[:r[3]], True, True, []]
-                        except QCamFunctionError, err: ###if sparse table doesn't work try getting a RangeTable
-                            if err.value == 1:  
-                                min = self.call(lib.GetParamMin, byref(s), getattr(lib,x))[2]
-                                max = self.call(lib.GetParamMax, byref(s), getattr(lib,x))[2]
-                                self.paramAttrs[self.translateToUser(x)] = [(min, max), True, True, []]
-                            else: raise 
-                except QCamFunctionError, err:
-                    if err.value == 1: pass    
-                    else: raise
-        #for x in lib('enums', 'QCam_ParamS32'):
-            elif x not in ['qprm64Exposure']:
-                try:
-                    if self.call(lib.GetParamS32, byref(s), getattr(lib, x))() == 0:
-                        try:
-                            table = (c_long *32)()
-                            r = self.call(lib.GetParamSparseTableS32, byref(s), getattr(lib,x), table, c_long(32))
-                            self.paramAttrs[self.translateToUser(x)] = [list(r[2])[:r[3]], True, True, []]
-                        except QCamFunctionError, err:
-                            if err.value == 1:
-                                min = self.call(lib.GetParamS32Min, byref(s), getattr(lib,x))[2]
-                                max = self.call(lib.GetParamS32Max, byref(s), getattr(lib,x))[2]
-                                self.paramAttrs[self.translateToUser(x)] = [(min, max), True, True, []]
-                            else: raise
-                except QCamFunctionError, err:
-                    if err.value == 1: pass
-                    else: raise
-        #for x in lib('enums', 'QCam_Param64'):
-            elif x not in ['qprmS32AbsoluteOffset', 'qprmS32RegulatedCoolingTemp']:
-                try:
-                    if self.call(lib.GetParam64, byref(s), getattr(lib, x))() == 0:
-                        try:
-                            table = (c_ulonglong *32)()
-                            r = self.call(lib.GetParamSparseTable64, byref(s), getattr(lib,x), table, c_long(32))
-                            self.paramAttrs[self.translateToUser(x)] = [list(r[2])[:r[3]], True, True, []]
-                        except QCamFunctionError, err:
-                            if err.value == 1:  ## qerrNotSupported
-                                min = self.call(lib.GetParam64Min, byref(s), getattr(lib,x))[2]
-                                max = self.call(lib.GetParam64Max, byref(s), getattr(lib,x))[2]
-                                self.paramAttrs[self.translateToUser(x)] = [(min, max), True, True, []]
-                            else: raise
-                except QCamFunctionError, err:
-                    if err.value == 1:  pass
-                    else: raise
+            attrs = self.probeParam(s, x)
+            if attrs is not None:
+                self.paramAttrs[self.translateToUser(x)] = attrs
         #print "      parameters are retrieved."
         #self.paramAttrs.pop('qprmExposure')
         #self.paramAttrs.pop('qprmOffset')
@@ -428,35 +470,55 @@ class QCameraClass:
                 
         ## rearrange trigger names
         trigNames = ['Normal', 'Strobe', 'Bulb']
+        seen = set(trigNames)
         for n in self.paramAttrs['triggerMode'][0]:
-            if n not in trigNames:
+            if n not in seen:
+                seen.add(n)
                 trigNames.append(n)
         self.paramAttrs['triggerMode'][0] = trigNames
                 
-        
+        self.paramAttrsValid = True
+        self.paramAttrsAll = allParams
         
         return self.paramAttrs
                                 
+    def probeParam(self, s, param):
+        """Return [acceptablevalues, isWritable, isReadable, [dependencies]] for a QCam parameter,
+        or None if the camera does not support it."""
+        get, getTable, getMin, getMax, ctype = self.paramProbeFns[param]
+        pid = self.paramIds[param]
+        sref = byref(s)
+        if self.callIfSupported(get, sref, pid) is None:
+            return None
+        ## first try to get a SparseTable; if that's not supported, use the range
+        table = (ctype*32)()
+        r = self.callIfSupported(getTable, sref, pid, table, c_long(32))
+        if r is not None:
+            return [r[2][:r[3]], True, True, []]
+        lo = self.callIfSupported(getMin, sref, pid)
+        hi = self.callIfSupported(getMax, sref, pid)
+        if lo is None or hi is None:
+            return None
+        return [(lo[2], hi[2]), True, True, []]
+                                
     def getNameFromEnum(self, enum, value):
         enum = self.translateToCamera(enum)
         if enum in self.paramEnums:
+            inv = self.paramEnumsInv[enum]
             if isinstance(value, list):
                 values = []
                 for j in value:
-                    for i in lib('enums', self.paramEnums[enum]):
-                        if lib('enums', self.paramEnums[enum])[i] == j:
-                            values.append(self.translateToUser(i))
+                    values.extend([self.translateToUser(i) for i in inv.get(j, [])])
                 return values
             else:
-                for i in lib('enums', self.paramEnums[enum]):
-                    if lib('enums', self.paramEnums[enum])[i] == value:
-                        return self.translateToUser(i)
+                if value in inv:
+                    return self.translateToUser(inv[value][0])
         else:
             return value
     
     def getEnumFromName(self, enum, value):
         enum = self.translateToCamera(enum)
-        return lib('enums', self.paramEnums[enum])[value]
+        return self.paramEnumsCache[enum][value]
             
                                 #print "old: ", a, "new: ", self.paramAttrs[x][i]
         ##### For camera on rig1, listParams returns: {                       
@@ -492,12 +554,12 @@ class QCameraClass:
         
                                 
     def getCameraInfo(self):
-        for x in lib('enums', 'QCam_Info'):
+        for x, infoId in self.infoIds.items():
             try:
-                a = self.call(lib.GetInfo, self.handle, getattr(lib, x))
+                a = self.call(lib.GetInfo, self.handle, infoId)
                 self.cameraInfo[x] = a[2]
             except QCamFunctionError, err:
-                if err.value == 1:
+                if err.value == self.errNotSupported:
                     #print "No info for: ", x
                     pass
                 else: raise
@@ -514,51 +576,59 @@ class QCameraClass:
     
     def getParams(self, params=None, asList=False):
         """Get a list of parameter values. Return a dictionary of name: value pairs"""
-        vals = OrderedDict()
         if params is None:
             params = self.paramAttrs.keys()
         
         s = self.readSettings()
-        for param in params:
-            if param == 'ringSize':
-                vals[param] = self.ringSize
-                continue
-            if param in self.groupParams:
-                vals[param] = self.getParams(self.groupParams[param], asList=True)
-                continue
-            
-            param2 = self.translateToCamera(param)
-                
-            if param2 in lib('enums', 'QCam_Param'):
-                value = self.call(lib.GetParam, byref(s), getattr(lib, param2))[2]
-            elif param2 in lib('enums', 'QCam_ParamS32'):
-                value = self.call(lib.GetParamS32, byref(s), getattr(lib, param2))[2]
-            elif param2 in lib('enums', 'QCam_Param64'):
-                value = self.call(lib.GetParam64, byref(s), getattr(lib, param2))[2]
-            elif param2 in self.cameraInfo:
-                value = self.cameraInfo[param2]
-            else:
-                raise Exception("%s is not recognized as a parameter." %param)
-            
-            if param2 in ['qprmRoiX', 'qprmRoiY', 'qprmRoiWidth', 'qprmRoiHeight']:
-                value = value*self.getParam('binningX')
-                
-            value = self.getNameFromEnum(param2, value)
-            value = self.convertUnitsToAcq4(self.translateToUser(param2), value)
-            
-            if param == 'binning':           ## just fake it.
-                vals[param] = (value,value)
-                continue
-            else:
-                vals[param] = value
-                continue
-        
+        vals = self._getParamsFromSettings(s, params)
         
         if asList:
             return vals.values()
         else:
             return vals
 
+    def _getParamsFromSettings(self, s, params):
+        """Return an OrderedDict of parameter values read from the settings struct *s*.
+        Binning is read once and shared by all region parameters."""
+        if regionParams.intersection(params):
+            binning = self._readParamFromSettings(s, 'binningX', None)
+        else:
+            binning = None  ## not needed; saves a driver call
+        read = self._readParamFromSettings
+        return OrderedDict([(param, read(s, param, binning)) for param in params])
+        
+    def _readParamFromSettings(self, s, param, binning):
+        """Return the value of a single parameter from the settings struct *s*.
+        Region parameters are scaled by *binning*."""
+        if param == 'ringSize':
+            return self.ringSize
+        if param in self.groupParams:
+            return [self._readParamFromSettings(s, p, binning) for p in self.groupParams[param]]
+        
+        param2 = self.translateToCamera(param)
+            
+        if param2 in self.enumParam:
+            value = self.call(lib.GetParam, byref(s), self.enumParam[param2])[2]
+        elif param2 in self.enumParamS32:
+            value = self.call(lib.GetParamS32, byref(s), self.enumParamS32[param2])[2]
+        elif param2 in self.enumParam64:
+            value = self.call(lib.GetParam64, byref(s), self.enumParam64[param2])[2]
+        elif param2 in self.cameraInfo:
+            value = self.cameraInfo[param2]
+        else:
+            raise Exception("%s is not recognized as a parameter." %param)
+        
+        if param2 in ['qprmRoiX', 'qprmRoiY', 'qprmRoiWidth', 'qprmRoiHeight']:
+            value = value*binning
+            
+        value = self.getNameFromEnum(param2, value)
+        value = self.convertUnitsToAcq4(self.translateToUser(param2), value)
+        
+        if param == 'binning':           ## just fake it.
+            return (value,value)
+        else:
+            return value
+
     def setParams(self, params, autoRestart=True, autoCorrect=True): 
         """Set camera parameters. Options are:
            params: a list of (param, value) pairs to be set. Parameters are set in the order specified.
@@ -581,8 +651,6 @@ class QCameraClass:
             #params = dict
         #print "Params to set:", params
         
-        s = self.readSettings()
-        
         ### Unpack grouped params
         for x in params.keys():
             if x in self.groupParams:
@@ -599,15 +667,32 @@ class QCameraClass:
                 del params[x]
                 
                 #return self.setParams(newDict)
+        
+        ## If every parameter already holds the requested value, there is no
+        ## need to talk to the camera at all.
+        shadow = self._paramShadow
+        for x in params:
+            if x not in shadow or shadow[x] != params[x]:
+                break
+        else:
+            return OrderedDict([(x, shadow[x]) for x in params]), False
             
+        s = self.readSettings()
+        sref = byref(s)
+        call = self.call
+        
         #changeTuple = {}
         
         ## need to track changes to the state as they are made since some parameters may interact
-        state = self.getParams(['binning', 'region'])
+        state = self._getParamsFromSettings(s, ['binning', 'region'])
         
         ## will also see whether there are actually any changes to make
-        current = self.getParams(params.keys())
+        current = self._getParamsFromSettings(s, params.keys())
         changed = False
+        
+        ## s is modified in place below; it only matches the camera again once the
+        ## settings have been sent and read back.
+        self._settingsValid = False
         #changedKeys = []  ## keys for parameters that have changed 
                           ### (this is not necessarily the same as params)
         
@@ -618,8 +703,7 @@ class QCameraClass:
                 if params[x] == current[x]:
                     continue
             except:
-                print "PARAMS:", params
-                print "CURRENT:", current
+                log.error("PARAMS: %s  CURRENT: %s", params, current)
                 raise
             
             if x == 'ringSize':
@@ -628,10 +712,12 @@ class QCameraClass:
                 continue
             if x == 'qprmImageFormat':
                 if params[x] != 'qfmtMono16':
-                    print "QCam driver currently only supports the 'qfmtMono16' image format."
+                    log.warning("QCam driver currently only supports the 'qfmtMono16' image format.")
                     continue
             #print "changed param", x, current[x], params[x]
             changed = True
+            if x in self.paramAttrsDeps:
+                self.paramAttrsValid = False
                 
             param = self.translateToCamera(x)
             #print "     1 param:", param
@@ -656,7 +742,7 @@ class QCameraClass:
                             value = max(allowableValues)
                     elif type(allowableValues) == list:
                         if value not in allowableValues:
-                            print "%s not an allowable value for QImaging camera. Allowable values are %s" %(value, allowableValues)
+                            log.warning("%s not an allowable value for QImaging camera. Allowable values are %s", value, allowableValues)
             #print "     4 value:", value
             
             
@@ -679,10 +765,10 @@ class QCameraClass:
                 #h = self.getParam('qprmRoiHeight')
                 #oldBinning = self.getParam('binning')[0]
                 
-                self.call(lib.SetParam, byref(s), getattr(lib, 'qprmRoiX'), c_ulong(int(x/value)))
-                self.call(lib.SetParam, byref(s), getattr(lib, 'qprmRoiY'), c_ulong(int(y/value)))
-                self.call(lib.SetParam, byref(s), getattr(lib, 'qprmRoiWidth'), c_ulong(int(w/value)))
-                self.call(lib.SetParam, byref(s), getattr(lib, 'qprmRoiHeight'), c_ulong(int(h/value)))
+                call(lib.SetParam, sref, self.paramIds['qprmRoiX'], c_ulong(int(x/value)))
+                call(lib.SetParam, sref, self.paramIds['qprmRoiY'], c_ulong(int(y/value)))
+                call(lib.SetParam, sref, self.paramIds['qprmRoiWidth'], c_ulong(int(w/value)))
+                call(lib.SetParam, sref, self.paramIds['qprmRoiHeight'], c_ulong(int(h/value)))
                 
             rgnParams = ['qprmRoiX', 'qprmRoiY', 'qprmRoiWidth', 'qprmRoiHeight']
             if param in rgnParams:
@@ -691,12 +777,12 @@ class QCameraClass:
                 state['region'][ind] = value  ## update state in case binning changes next
                 value = value/binn
                 
-            if param in lib('enums', 'QCam_Param'):
-                self.call(lib.SetParam, byref(s), getattr(lib, param), c_ulong(int(value)))
-            elif param in lib('enums', 'QCam_ParamS32'):
-                self.call(lib.SetParamS32, byref(s), getattr(lib, param), c_long(int(value)))
-            elif param in lib('enums', 'QCam_Param64'):
-                self.call(lib.SetParam64, byref(s), getattr(lib, param), c_ulonglong(int(value)))
+            if param in self.enumParam:
+                call(lib.SetParam, sref, self.enumParam[param], c_ulong(int(value)))
+            elif param in self.enumParamS32:
+                call(lib.SetParamS32, sref, self.enumParamS32[param], c_long(int(value)))
+            elif param in self.enumParam64:
+                call(lib.SetParam64, sref, self.enumParam64[param], c_ulonglong(int(value)))
         #self.queueSettingsDict = {}
         #for x in params:
             #self.queueSettingsDict[x] = value
@@ -707,36 +793,38 @@ class QCameraClass:
             
         if not changed:
             #return self.getParams(changedKeys), False
+            self._settingsValid = True
+            ## Only remember values the camera actually holds as requested; ringSize
+            ## and skipped image formats were not taken from the settings struct.
+            for x in params:
+                if x != 'ringSize' and params[x] == current[x]:
+                    self._paramShadow[x] = current[x]
             return current, False
         
-        with self.mutex:
-            #print "Mutex locked from qcam.setParams()"
-            if self.stopSignal == True:
-                #self.mutex.unlock()
-                self.call(lib.SendSettingsToCam, self.handle, byref(s))
-
-                restart = False
-            elif self.stopSignal == False: ##### Can't figure out how to get QueueSettings to work....so we'll just stop and start the camera.
-                #try:
-                    #print "QCam about to Queue settings. params:", params
-                    #s.size = sizeof(s)
-                    ##self.mutex.unlock()
-                    #var = c_void_p(0)
-                    #self.call(lib.QueueSettings, self.handle, byref(s), self.fnpNull, lib.qcCallbackDone, var, 0)
-                    #restart = False
-                    #print "QCamSettings are queued. Look for message from callback..."
-                #except QCamFunctionError:
-                #self.stop()
-                self.call(lib.SendSettingsToCam, self.handle, byref(s))
-                #self.start()
-                restart = True
-                    
-
-        #print "Mutex released from qcam.setParams()"
+        ## stopSignal is a plain bool, so reading it does not need the mutex; holding the
+        ## mutex here would only make setParams wait for any callback in progress.
+        restart = not self.stopSignal
+        #if restart:  ##### Can't figure out how to get QueueSettings to work....so we'll just stop and start the camera.
+            #try:
+                #print "QCam about to Queue settings. params:", params
+                #s.size = sizeof(s)
+                #var = c_void_p(0)
+                #self.call(lib.QueueSettings, self.handle, byref(s), self.fnpNull, lib.qcCallbackDone, var, 0)
+                #restart = False
+                #print "QCamSettings are queued. Look for message from callback..."
+            #except QCamFunctionError:
+        self.call(lib.SendSettingsToCam, self.handle, sref)
+        self._frameGeometry = None
+
         #ret = {}
         #for x in params:
             #ret[x] = self.getParam(x)
-        ret = self.getParams(self.getParams(params.keys()))
+        ## settings were just sent, so this reads them back from the camera once
+        ## (the driver may have adjusted some values) and decodes every param from that.
+        ret = self.getParams(params.keys())
+        ## Changing one parameter may have altered others (eg. binning rescales the
+        ## region), so start the shadow over from the values just read back.
+        self._paramShadow = dict([(x, v) for x, v in ret.items() if x != 'ringSize'])
         self.getImageSize() ## Run this function to update image size in cameraInfo dictionary
         #print "Set params to:", dict
         #if not autoRestart:
@@ -744,33 +832,33 @@ class QCameraClass:
             
         return ret, restart
     
-    def mkFrame(self):
+    def mkFrame(self, buffer=None):
+        """Return a (frame, array) pair. The camera writes image data directly into *array*.
+        If *buffer* is given, it must be a contiguous uint16 array of the current image
+        size and is used as the frame's storage instead of allocating a new array."""
         #s = self.call(lib.GetInfo, self.handle, lib.qinfImageWidth)[2] * self.call(lib.GetInfo, self.handle, lib.qinfImageHeight)[2]
-        imForm = self.getParam('qprmImageFormat')
+        ## The image format is always qfmtMono16: it is set from cameraDefaults in __init__
+        ## and setParams refuses any other format.
+        s, rows = self.frameGeometry()
         #print 'mkFrame: s', s
-        
-
-        if imForm in ['qfmtMono16']:
-            s = self.getImageSize() ## ImageSize returns the size in bytes
-            frame = lib.Frame()
-            array = ascontiguousarray(empty(s/2, dtype=uint16))
-            #array = ascontiguousarray(empty(s, dtype=uint16))
-            frame.bufferSize = s*2
-        elif imForm not in ['qfmtMono16']:
-            self.setParams([('qprmImageFormat','qfmtMono16')])
-            s = self.getImageSize() ## ImageSize returns the size in bytes
-            frame = lib.Frame()
-            array = ascontiguousarray(empty(s/2, dtype=uint16))
-            #array = ascontiguousarray(empty(s, dtype=uint16))
-            frame.bufferSize = s*2
+            
+        ## s is the image size in bytes
+        frame = lib.Frame()
+        if buffer is not None and buffer.size == s//2:
+            array = buffer
+        else:
+            array = empty(s//2, dtype=uint16)  ## already contiguous
+        #array = ascontiguousarray(empty(s, dtype=uint16))
+        frame.bufferSize = s*2
 
         #print "frameshape:", frame.shape
         #print 'size:', s, "height:", self.getParam('regionH'), 'width:', self.getParam('regionW'), 'binning:', self.getParam('binning')[0]
         #array.shape=(self.getParam('regionH'), self.getParam('regionW') )
-        array.shape = (self.getParam('regionH')/self.getParam('binning')[0], -1)
+        array.shape = (rows, -1)
         array = array.transpose()
         #print 'array.size', array.size, 'array.shape', array.shape
         frame.pBuffer = array.ctypes.data ###sets the frame buffer pointer to point to the array? So camera writes data directly into the array?
+        frame.array = array  ## the camera writes through pBuffer, so the frame must keep its buffer alive
         #for x in array:
             #x = 1000
         #print 'mkFrame: frame.shape', frame.shape
@@ -778,6 +866,24 @@ class QCameraClass:
         
         return (frame, array)
     
+    def frameGeometry(self):
+        """Return (imageSize, rows) for the current settings, where imageSize is in bytes
+        and rows is the binned region height. The values are cached until the next
+        setParams call that changes anything."""
+        if self._frameGeometry is None:
+            h, binning = self.getParams(['regionH', 'binning'], asList=True)
+            self._frameGeometry = (self.getImageSize(), h/binning[0])
+        return self._frameGeometry
+    
+    def allocRing(self):
+        """Return a (ringSize, pixels) array that holds every frame of the ring buffer
+        in one contiguous block. The block is reused by later calls to start() unless
+        the image size or ring size has changed."""
+        n = self.frameGeometry()[0]//2
+        if self.ringBuffer is None or self.ringBuffer.shape != (self.ringSize, n):
+            self.ringBuffer = empty((self.ringSize, n), dtype=uint16)
+        return self.ringBuffer
+    
     def grabFrame(self):
         s = self.call(lib.GetInfo, self.handle, lib.qinfImageSize)[2]
         #s = lib.GetInfo(handle, lib.qinfImageSize)[2]
@@ -793,7 +899,7 @@ class QCameraClass:
 
         self.frames = []
         self.arrays = []
-        self.lastImages = []
+        self.lastImages = deque()
         self.frameTimes = [None]*self.ringSize
         #global i, stopsignal
         #self.mutex.lock()
@@ -805,17 +911,21 @@ class QCameraClass:
             #print "Mutex locked from qcam.start()"
             self.stopSignal = False
             self.i=0
+        self._paramShadow = {}
         #print "Mutex released from qcam.start()"
         self.call(lib.SetStreaming, self.handle, 1)
+        ring = self.allocRing()
         for x in range(self.ringSize):
-            f, a = self.mkFrame()
+            f, a = self.mkFrame(ring[x])
             self.frames.append(f)
             #print "start: a.shape", a.shape
             self.arrays.append(a)
+        ## QueueFrame arguments for each ring slot, built once per acquisition
+        self._frameArgs = [(f, self.fnp1, self._queueFlags, 0, i) for i, f in enumerate(self.frames)]
         #print "Camera started. Frame shape:", self.arrays[0].shape
         #print "Camera region:", self.getParam('region')
         for x in range(2):  ## need 2 frames queued to allow simultaneous exposure and frame transfer
-            self.call(lib.QueueFrame, self.handle, self.frames[self.i], self.fnp1, lib.qcCallbackDone|lib.qcCallbackExposeDone, 0, self.i)
+            self.call(self._queueFrame, self.handle, *self._frameArgs[self.i])
             self.mutex.lock()
             self.i += 1
             #self.counter +=1
@@ -837,23 +947,38 @@ class QCameraClass:
             #print "Exposure done. Time: %f, Duration: %f" %
             return
         if args[2] != 0:
-            for x in lib('enums', 'QCam_Err'):
-                if lib('enums', 'QCam_Err')[x] == args[2]:
-                    raise QCamFunctionError(args[2], "There was an error during QueueFrame/Callback. Error code = %s" %(x))
+            raise QCamFunctionError(args[2], "There was an error during QueueFrame/Callback. Error code = %s" %(self.errNames.get(args[2], args[2])))
+        
+        ## A frame-done callback can still arrive after stop() has released the
+        ## arrays; such a frame is dropped. The mutex is only held to look up the
+        ## slot: src is a view of the persistent ring buffer, so it stays valid
+        ## after the lock is released, and the slot is not requeued until
+        ## ringSize-2 more frames have arrived. The copy is made outside the lock.
+        with self.mutex:
+            if self.arrays is None:
+                return
+            src = self.arrays[args[1]]
+        data = src.copy()
+        
+        ## counter is only touched from this callback, and deque.append is atomic,
+        ## so handing the frame to newFrames does not need the mutex.
+        #print "set last index", args[1]
+        ## stored as (id, data, time); newFrames builds the frame dicts
+        self.lastImages.append((self.counter, data, self.frameTimes[args[1]]))
+        self.counter += 1
+        
         #self.mutex.lock()
         with self.mutex:
             #print "Mutex locked from qcam.callBack1()"
-            #print "set last index", args[1]
-            self.lastImages.append({'id':self.counter, 'data':self.arrays[args[1]].copy(), 'time': self.frameTimes[args[1]], 'exposeDoneTime':self.frameTimes[args[1]]})
-            self.counter += 1
-            
             if self.stopSignal == False:
                 #self.mutex.unlock()
                 #size = self.getImageSize()
                 #if len(self.arrays[self.i]) != size/2:
                     #self.frames[self.i],self.arrays[self.i] = self.mkFrame()
                 #### Need to check that frame is the right size given settings, and if not, make a new frame.
-                self.call(lib.QueueFrame, self.handle, self.frames[self.i], self.fnp1, lib.qcCallbackDone|lib.qcCallbackExposeDone, 0, self.i)
+                err = self._queueFrame(self.handle, *self._frameArgs[self.i])()
+                if err != 0:
+                    raise QCamFunctionError(err, "There was an error running QueueFrame. Error code = %s" %(self.errNames.get(err, err)))
                 self.i = ( self.i+1) % self.ringSize
                 #self.counter +=1
                 #if self.i != self.ringSize-1:
@@ -869,7 +994,7 @@ class QCameraClass:
         #for x in args[0]:
             #dict[x] = self.getParam(x)
         #print "Set params to:", dict
-        print "Queued settings have been changed. (Message from queueSettings callback). Settings:", args
+        log.debug("Queued settings have been changed. (Message from queueSettings callback). Settings: %s", args)
 
     def stop(self):
 
@@ -881,19 +1006,28 @@ class QCameraClass:
             #print "stop() 1"
             self.stopSignal = True
             #print "stop() 2, self.stopSignal:", self.stopSignal
+        self._paramShadow = {}
         a = self.call(lib.Abort, self.handle)
         #print "stop() 3", a()
         self.call(lib.SetStreaming, self.handle, 0)
         #time.sleep(0.5)
         #self.mutex.unlock()
+        
+        ## no frames are queued any more; drop the frame structs and array views
+        ## (frameTimes is left alone in case a late expose callback arrives).
+        ## Done under the mutex so callBack1 sees either the arrays or None.
+        with self.mutex:
+            self.frames = None
+            self.arrays = None
+            self._frameArgs = None
 
     def newFrames(self):
-        with self.mutex:
-            #print "Mutex locked from qcam.lastFrame()"
-            a = self.lastImages
-            self.lastImages = []
-            #self.mutex.unlock()
-        #print "Mutex released from qcam.lastFrame()"
+        ## callBack1 may append while we drain; popleft is atomic so no lock is needed
+        images = self.lastImages
+        a = []
+        while images:
+            id, data, t = images.popleft()
+            a.append({'id':id, 'data':data, 'time':t, 'exposeDoneTime':t})
         return a 
         
 if __name__ == '__main__':
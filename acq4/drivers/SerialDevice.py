@@ -101,16 +101,20 @@ class SerialDevice(object):
         logging.info('Serial port %s write: %r', self.__serialOpts['port'], data)
         self.serial.write(data)
 
-    def read(self, length, timeout=5, term=None):
+    def read(self, length, timeout=5, term=None, maxSleep=0.05):
         """
         Read *length* bytes or raise TimeoutError after *timeout* has elapsed.
 
         If *term* is given, check that the packet is terminated with *term* and 
         return the packet excluding *term*. If the packet is not terminated 
         with *term*, then DataError is raised.
+
+        *maxSleep* caps the interval between serial port checks. Devices that
+        reply within a few ms may lower this to avoid oversleeping after the
+        packet has arrived.
         """
         #self.serial.setTimeout(timeout) #broken!
-        packet = self._readWithTimeout(length, timeout)
+        packet = self._readWithTimeout(length, timeout, maxSleep)
         if len(packet) < length:
             raise TimeoutError("Timed out waiting for serial data (received so far: %s)" % repr(packet), packet)
         if term is not None:
@@ -124,11 +128,14 @@ class SerialDevice(object):
         logging.info('Serial port %s read: %r', self.__serialOpts['port'], packet)
         return packet
         
-    def _readWithTimeout(self, nBytes, timeout):
+    def _readWithTimeout(self, nBytes, timeout, maxSleep=0.05):
         # Note: pyserial's timeout mechanism is broken (specifically, calling setTimeout can cause 
         # serial data to be lost) so we implement our own in readWithTimeout().
         start = time.time()
-        packet = ''
+        # collect chunks and join once at the end rather than re-copying the
+        # partial packet every time more data arrives
+        chunks = []
+        received = 0
         # Interval between serial port checks is adaptive:
         #   * start with very short interval for low-latency reads
         #   * iteratively increase interval duration to reduce CPU usage on long reads
@@ -136,14 +143,18 @@ class SerialDevice(object):
         while time.time()-start < timeout:
             waiting = self.serial.inWaiting()
             if waiting > 0:
-                readBytes = min(waiting, nBytes-len(packet))
-                packet += self.serial.read(readBytes)
+                readBytes = min(waiting, nBytes-received)
+                chunk = self.serial.read(readBytes)
+                chunks.append(chunk)
+                received += len(chunk)
                 sleep = 100e-6  # every time we read data, reset sleep time
-            if len(packet) >= nBytes:
+            if received >= nBytes:
                 break
             time.sleep(sleep)
-            sleep = min(0.05, 2*sleep) # wait a bit longer next time
-        return packet
+            sleep = min(maxSleep, 2*sleep) # wait a bit longer next time
+        if len(chunks) == 1:
+            return chunks[0]
+        return ''.join(chunks)
 
     def readUntil(self, term, minBytes=0, timeout=5):
         """Read from the serial port until *term* is received, or *timeout* has elapsed.
@@ -31,8 +31,7 @@ def step_curve(decay_threshold=-1):
         s['encoder_prescaler'] = 6400
         for i in range(150):
             s.move(1, relative=True)
-            while s['target_pos_reached'] == 0:
-                pass
+            s.wait_for_position_reached()
             x.append(s['encoder_position'])
             x.append(s['encoder_position'])
             x.append(s['encoder_position'])
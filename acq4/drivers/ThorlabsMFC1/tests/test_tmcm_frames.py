@@ -0,0 +1,103 @@
+"""
+Unit tests for TMCM140 command packing and reply parsing. These do not
+require hardware; for interactive tests with a connected controller, see
+../test_tmcm.py.
+"""
+import os, imp, struct, random
+import pytest
+
+## Load tmcm.py directly rather than through the acq4 package; importing acq4
+## starts Qt, which these tests do not need.
+pytest.importorskip('serial')
+tmcm = imp.load_source('tmcm', os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tmcm.py'))
+TMCM140, TMCMError, COMMANDS = tmcm.TMCM140, tmcm.TMCMError, tmcm.COMMANDS
+
+
+class FakeTMCM(TMCM140):
+    """TMCM140 that reads replies from a string instead of a serial port.
+    """
+    def __init__(self, data='', module_addr=1):
+        self.module_addr = module_addr
+        self._waiting_for_reply = False
+        self.data = data
+
+    def read(self, length, **kwds):
+        d, self.data = self.data[:length], self.data[length:]
+        return d
+
+    def readAll(self):
+        d, self.data = self.data, ''
+        return d
+
+
+def ref_pack_cmd(module_addr, cmd_num, type, motor, value):
+    # straightforward packing: signed/unsigned struct plus summed checksum
+    fmt = '>BBBBi' if value < 0 else '>BBBBI'
+    cmd = struct.pack(fmt, module_addr, cmd_num, type, motor, value)
+    return cmd + chr(sum(bytearray(cmd)) & 0xFF)
+
+def mk_reply(status, cmd_num, value, module_addr=1, reply_addr=2):
+    frame = struct.pack('>BBBBi', reply_addr, module_addr, status, cmd_num, value)
+    return frame + chr(sum(bytearray(frame)) & 0xFF)
+
+
+def test_pack_cmd():
+    values = [0, 1, -1, 255, 256, -256, 0x00FF00FF, 0xFF00FF00, 0x80808080,
+              2**31-1, -2**31, 2**32-1]
+    rand = random.Random(0)
+    values += [rand.randint(-2**31, 2**32-1) for i in range(2000)]
+
+    for addr in (1, 255):
+        t = FakeTMCM(module_addr=addr)
+        for v in values:
+            type = rand.randint(0, 255)
+            motor = rand.randint(0, 255)
+            assert t._pack_cmd('sap', type, motor, v) == ref_pack_cmd(addr, COMMANDS['sap'], type, motor, v)
+            assert t._pack_cmd(COMMANDS['mvp'], 255, 255, v) == ref_pack_cmd(addr, COMMANDS['mvp'], 255, 255, v)
+
+    t = FakeTMCM()
+    with pytest.raises(AssertionError):
+        t._pack_cmd('sap', 0, 0, 2**32)
+    with pytest.raises(AssertionError):
+        t._pack_cmd('sap', 0, 0, -2**31-1)
+
+
+def test_get_replies():
+    vals = [(100, 6, 0), (100, 5, -1), (100, 6, -2**31), (100, 6, 2**31-1)]
+    t = FakeTMCM(''.join([mk_reply(*v) for v in vals]))
+    t._waiting_for_reply = True
+    replies = t._get_replies(len(vals))
+    assert replies == [(2, 1) + v + (ord(mk_reply(*v)[8]),) for v in vals]
+    assert t._waiting_for_reply is False
+    assert t.data == ''
+
+    # single reply
+    t = FakeTMCM(mk_reply(100, 6, 12345))
+    t._waiting_for_reply = True
+    assert t._get_reply()[4] == 12345
+
+    # no reply expected
+    with pytest.raises(Exception):
+        FakeTMCM(mk_reply(100, 6, 0))._get_replies(1)
+
+
+def test_get_replies_error():
+    # error in the second frame; all frames are still consumed
+    t = FakeTMCM(mk_reply(100, 5, 0) + mk_reply(4, 5, 0) + mk_reply(3, 5, 0))
+    t._waiting_for_reply = True
+    with pytest.raises(TMCMError) as exc:
+        t._get_replies(3)
+    assert exc.value.status == 4
+    assert t.data == ''
+    assert t._waiting_for_reply is False
+
+
+def test_get_replies_checksum():
+    bad = mk_reply(100, 6, 7)
+    bad = bad[:8] + chr((ord(bad[8]) + 1) & 0xFF)
+    t = FakeTMCM(mk_reply(100, 6, 7) + bad)
+    t._waiting_for_reply = True
+    with pytest.raises(Exception) as exc:
+        t._get_replies(2)
+    assert 'checksum' in str(exc.value)
+    assert not isinstance(exc.value, TMCMError)
@@ -4,23 +4,17 @@ Low-level serial communication for Trinamic TMCM-140-42-SE controller
 """
 
 
-import serial, struct, time, collections
-
-try:
-    # this is nicer because it provides deadlock debugging information
-    from acq4.util.Mutex import RecursiveMutex as RLock
-except ImportError:
-    from threading import RLock
+import serial, struct, time, collections, os, sys, threading
+import numpy as np
 
 try:
     from ..SerialDevice import SerialDevice, TimeoutError, DataError
 except ValueError:
-    ## relative imports not allowed when running from command prompt, so
-    ## we adjust sys.path when running the script for testing
-    if __name__ == '__main__':
-        import sys, os
-        sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
-        from SerialDevice import SerialDevice, TimeoutError, DataError
+    ## relative imports not allowed when running from command prompt (or when
+    ## this file is loaded on its own, as the unit tests do), so we adjust
+    ## sys.path to find SerialDevice
+    sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+    from SerialDevice import SerialDevice, TimeoutError, DataError
 
 
 def threadsafe(method):
@@ -172,6 +166,33 @@ CONDITIONS = {
 }
 
 
+# Command numbers used in the most frequent calls; these skip the COMMANDS
+# lookup in _pack_cmd.
+CMD_ROR = COMMANDS['ror']
+CMD_ROL = COMMANDS['rol']
+CMD_MST = COMMANDS['mst']
+CMD_MVP = COMMANDS['mvp']
+CMD_SAP = COMMANDS['sap']
+CMD_GAP = COMMANDS['gap']
+CMD_AAP = COMMANDS['aap']
+
+
+# Precompiled packer for command frames. Values are always packed unsigned;
+# negative values are masked to 32 bits first, which yields the same bytes as 
+# a signed pack. The struct includes the trailing checksum.
+_CMD_STRUCT = struct.Struct('>BBBBIB')
+
+# Reply frame layout; a block of N replies is parsed with a single frombuffer.
+_REPLY_DTYPE = np.dtype([
+    ('reply_addr', 'u1'),
+    ('module_addr', 'u1'),
+    ('status', 'u1'),
+    ('cmd_num', 'u1'),
+    ('value', '>i4'),
+    ('chksum', 'u1'),
+])
+
+
 STATUS = {
     1: "Wrong checksum",
     2: "Invalid command",
@@ -187,18 +208,30 @@ class TMCMError(Exception):
         self.status = status
         msg = STATUS[status]
         
-        Exception.__init__(msg)
+        Exception.__init__(self, msg)
         
 
 class TMCM140(SerialDevice):
 
-    def __init__(self, port, baudrate=9600, module_addr=1):
+    def __init__(self, port, baudrate=9600, module_addr=1, debug_lock=False):
         """
         port: serial COM port (eg. COM3 or /dev/ttyACM0)
         baudrate: 9600 by default
         module_addr: 1 by default
+        debug_lock: if True, use a mutex that records a traceback on every 
+                    acquire to help diagnose deadlocks. This is much slower than
+                    the default threading.RLock, which is taken on every command.
         """
-        self.lock = RLock(debug=True)
+        self.lock = None
+        if debug_lock:
+            try:
+                # this is nicer because it provides deadlock debugging information
+                from acq4.util.Mutex import RecursiveMutex
+                self.lock = RecursiveMutex(debug=True)
+            except ImportError:
+                pass
+        if self.lock is None:
+            self.lock = threading.RLock()
         self.port = port
         assert isinstance(module_addr, int)
         assert module_addr > 0
@@ -206,11 +239,33 @@ class TMCM140(SerialDevice):
         self.module_str = chr(module_addr+64)
         self._waiting_for_reply = False
         SerialDevice.__init__(self, port=self.port, baudrate=baudrate)
+        self._set_low_latency()
+
+    def _set_low_latency(self):
+        """Lower the FTDI USB latency timer to 1 ms, if possible.
+        
+        FTDI USB-serial adapters hold incoming data for up to 16 ms before
+        passing it to the host, which delays every reply. On Linux this is 
+        set through sysfs; ports that are not FTDI devices, or that we lack 
+        permission to configure, are left unchanged. On Windows the timer must
+        be set in the Device Manager (Port Settings > Advanced > Latency Timer).
+        """
+        if not sys.platform.startswith('linux'):
+            return
+        dev = os.path.basename(os.path.realpath(self.port))
+        path = '/sys/bus/usb-serial/devices/%s/latency_timer' % dev
+        try:
+            with open(path, 'w') as fh:
+                fh.write('1')
+        except (IOError, OSError):
+            pass
 
     @threadsafe
     def command(self, cmd, type, motor, value):
         """Send a command to the controller and return the reply.
         
+        *cmd* may be a command name from COMMANDS or its command number.
+        
         If an error is returned from the controller then raise an exception.
         """
         self._send_cmd(cmd, type, motor, value)
@@ -225,18 +280,18 @@ class TMCM140(SerialDevice):
         assert isinstance(velocity, int)        
         assert -2047 <= velocity <= 2047
         if velocity < 0:
-            direction = 'l'
+            cmd = CMD_ROL
             velocity = -velocity
         else:
-            direction = 'r'
-        self.command('ro'+direction, 0, 0, velocity)
+            cmd = CMD_ROR
+        self.command(cmd, 0, 0, velocity)
 
     def stop(self):
         """Stop the motor.
         
         Note: does not stop currently running programs.
         """
-        self.command('mst', 0, 0, 0)
+        self.command(CMD_MST, 0, 0, 0)
         
     def move(self, pos, relative=False, velocity=None):
         """Rotate until reaching *pos*.
@@ -254,11 +309,24 @@ class TMCM140(SerialDevice):
             raise NotImplementedError()
         
         type = 1 if relative else 0
-        self.command('mvp', type, 0, pos)
+        self.command(CMD_MVP, type, 0, pos)
+        
+    def wait_for_position_reached(self, timeout=None, interval=5e-3):
+        """Block until the motor reports that the target position is reached.
+        
+        The target_pos_reached flag is checked every *interval* seconds rather
+        than continuously, which leaves the CPU and the serial port free for 
+        other callers. Raise TimeoutError if *timeout* seconds elapse first.
+        """
+        start = time.time()
+        while self.get_param('target_pos_reached') == 0:
+            if timeout is not None and time.time() - start > timeout:
+                raise TimeoutError("Timed out waiting for motor to reach target position.", None)
+            time.sleep(interval)
         
     def get_param(self, param):
         pnum = abs(PARAMETERS[param])
-        return self.command('gap', pnum, 0, 0)[4]
+        return self.command(CMD_GAP, pnum, 0, 0)[4]
         
     def __getitem__(self, param):
         return self.get_param(param)
@@ -269,6 +337,12 @@ class TMCM140(SerialDevice):
         If valus is 'accum' then the parameter is set from the accumulator
         register.
         """
+        self.command(*self._set_param_cmd(param, value, **kwds))
+
+    def _set_param_cmd(self, param, value, **kwds):
+        """Return the (cmd, type, motor, value) arguments needed to set a 
+        parameter, after checking that the parameter may be written.
+        """
         pnum = PARAMETERS[param]
         if pnum < 0:
             raise TypeError("Parameter %s is read-only." % param)
@@ -277,18 +351,25 @@ class TMCM140(SerialDevice):
                 raise Exception("Refusing to set current > 100 (this can damage the motor). "
                                 "To override, use force=True.")
         if value == 'accum':
-            self.command('aap', pnum, 0, 0)
+            return (CMD_AAP, pnum, 0, 0)
         else:
-            self.command('sap', pnum, 0, value)
+            return (CMD_SAP, pnum, 0, value)
 
     @threadsafe
     def set_params(self, **kwds):
         """Set multiple parameters.
         
+        All commands are written to the serial port in a single write and 
+        the replies are read back together, so the total time is close to one 
+        round trip rather than one per parameter.
+        
         The driver is thread-locked until all parameters are set.
         """
-        for param, value in kwds.items():
-            self.set_param(param, value)
+        cmds = [self._set_param_cmd(param, value) for param, value in kwds.items()]
+        if len(cmds) == 0:
+            return
+        self._send_cmds(cmds)
+        self._get_replies(len(cmds))
         
     def __setitem__(self, param, value):
         return self.set_param(param, value)
@@ -388,52 +469,75 @@ class TMCM140(SerialDevice):
     def _send_cmd(self, cmd, type, motor, value):
         """Send a command to the controller.
         """
+        self._send_cmds([(cmd, type, motor, value)])
+
+    def _send_cmds(self, cmds):
+        """Send a sequence of (cmd, type, motor, value) commands to the 
+        controller in a single write.
+        """
         if self._waiting_for_reply:
             raise Exception("Cannot send command; previous reply has not been "
                             "received yet.")
-        cmd_num = COMMANDS[cmd]
+        out = ''.join([self._pack_cmd(*cmd) for cmd in cmds])
+        self.write(out)
+        self._waiting_for_reply = True
+
+    def _pack_cmd(self, cmd, type, motor, value):
+        """Return the 9-byte frame for a single command.
+        """
+        cmd_num = cmd if isinstance(cmd, int) else COMMANDS[cmd]
         assert isinstance(type, int)
         assert isinstance(motor, int)
         
-        # Try packing the value first as unsigned, then signed. (the overlapping
-        # integer ranges have identical bit representation, so there is no 
-        # ambiguity)
-        try:
-            cmd = struct.pack('>BBBBI', self.module_addr, cmd_num, type, motor, value)
-        except struct.error:
-            cmd = struct.pack('>BBBBi', self.module_addr, cmd_num, type, motor, value)
-            
-        chksum = sum(bytearray(cmd)) % 256
-        out = cmd + struct.pack('B', chksum)
-        self.write(out)
-        self._waiting_for_reply = True
+        assert -2**31 <= value < 2**32
+        
+        value &= 0xFFFFFFFF
+        # The checksum is the sum of all frame bytes. Add the four bytes of
+        # value pairwise in 16-bit lanes rather than iterating over the packed
+        # string.
+        vsum = (value & 0x00FF00FF) + ((value >> 8) & 0x00FF00FF)
+        vsum = (vsum & 0xFFFF) + (vsum >> 16)
+        chksum = (self.module_addr + cmd_num + type + motor + vsum) & 0xFF
+        return _CMD_STRUCT.pack(self.module_addr, cmd_num, type, motor, value, chksum)
         
     def _get_reply(self):
         """Read and parse a reply from the controller.
         
         Raise an exception if an error was reported.
         """
+        return self._get_replies(1)[0]
+
+    def _get_replies(self, n):
+        """Read and parse *n* consecutive replies from the controller.
+        
+        All replies are read before checking for errors so that the serial
+        buffer is left empty. Raise an exception if any error was reported.
+        """
         if not self._waiting_for_reply:
             raise Exception("No reply expected.")
         
         try:
-            d = self.read(9)
+            # Replies usually arrive within a few ms; poll at least every 1 ms
+            # so we return as soon as the last frame is complete rather than
+            # sleeping through the default backoff.
+            d = self.read(9 * n, maxSleep=1e-3)
         finally:
             self._waiting_for_reply = False
         d2 = self.readAll()
         if len(d2) > 0:
             raise Exception("Error: extra data while reading reply.")
         
-        parts = struct.unpack('>BBBBiB', d)
-        reply_addr, module_addr, status, cmd_num, value, chksum = parts
-        
-        if chksum != sum(bytearray(d[:-1])) % 256:
+        # verify all checksums at once
+        frames = np.frombuffer(d, dtype=np.uint8).reshape(n, 9)
+        if not np.array_equal(frames[:, :8].sum(axis=1) & 0xFF, frames[:, 8]):
             raise Exception("Invalid checksum reading from controller.")
         
-        if status < 100:
-            raise TMCMError(status)        
+        replies = np.frombuffer(d, dtype=_REPLY_DTYPE)
+        errors = replies['status'][replies['status'] < 100]
+        if len(errors) > 0:
+            raise TMCMError(int(errors[0]))
         
-        return parts
+        return replies.tolist()
    
 
 class ProgramManager(object):
@@ -49,13 +49,22 @@ class FileAnalysisView(QtGui.QWidget):
         self.ui.analysisModuleList.itemDoubleClicked.connect(self.loadModule)
         self.ui.databaseCombo.currentIndexChanged.connect(self.dbComboChanged)
         
+        ## name of the manager's base directory, used as the starting point for file dialogs
+        self.baseDirName = None
+        self.baseDirChanged()
+        self.man.sigBaseDirChanged.connect(self.baseDirChanged)
+        
+    def baseDirChanged(self):
+        bd = self.man.getBaseDir()
+        if bd is None:
+            self.baseDirName = None
+        else:
+            self.baseDirName = bd.name()
 
     def openDbClicked(self):
-        bd = self.man.getBaseDir()
+        bd = self.baseDirName
         if bd is None:
             bd = ""
-        else:
-            bd = bd.name()
         self.fileDialog = FileDialog(self, "Select Database File", bd, "SQLite Database (*.sqlite *.sql);;All Files (*.*)")
         #self.fileDialog.setFileMode(QtGui.QFileDialog.AnyFile)
         self.fileDialog.show()
@@ -89,6 +98,7 @@ class FileAnalysisView(QtGui.QWidget):
             
         
         self.dbFile = fileName
+        self.closeDb()
         self.db = database.AnalysisDatabase(self.dbFile, dataModel=self.currentModel)
         self.sigDbChanged.emit()
         
@@ -101,14 +111,18 @@ class FileAnalysisView(QtGui.QWidget):
         self.openDb(fn)
         
     def quit(self):
+        self.closeDb()
+        
+    def closeDb(self):
         if self.db is not None:
             self.db.close()
+            self.db = None
         
     def createDbClicked(self):
-        bd = self.man.getBaseDir()
+        bd = self.baseDirName
         if bd is None:
             raise Exception("Must select a base directory before creating database.")
-        self.fileDialog = FileDialog(self, "Create Database File", bd.name(), "SQLite Database (*.sqlite *.sql);;All Files (*.*)")
+        self.fileDialog = FileDialog(self, "Create Database File", bd, "SQLite Database (*.sqlite *.sql);;All Files (*.*)")
         #self.fileDialog.setFileMode(QtGui.QFileDialog.AnyFile)
         self.fileDialog.setAcceptMode(QtGui.QFileDialog.AcceptSave) 
         self.fileDialog.setOption(QtGui.QFileDialog.DontConfirmOverwrite)
@@ -118,10 +132,11 @@ class FileAnalysisView(QtGui.QWidget):
     def createDb(self, fileName):
         #fn = str(QtGui.QFileDialog.getSaveFileName(self, "Create Database File", self.man.getBaseDir().name(), "SQLite Database (*.sqlite)", None, QtGui.QFileDialog.DontConfirmOverwrite))
         fileName = str(fileName)
-        if fileName is '':
+        if not fileName:
             return
             
         self.dbFile = fileName
+        self.closeDb()
         self.db = database.AnalysisDatabase(self.dbFile, dataModel=self.currentModel, baseDir=self.man.getBaseDir())
         self.ui.databaseCombo.blockSignals(True)
         try:
@@ -472,8 +472,10 @@ class PlotCurveItem(GraphicsObject):
             p.fillPath(self.fillPath, self.opts['brush'])
             profiler('draw fill path')
             
-        sp = fn.mkPen(self.opts['shadowPen'])
-        cp = fn.mkPen(self.opts['pen'])
+        ## setPen/setShadowPen already store private copies; no need to
+        ## build new QPens on every paint.
+        sp = self.opts['shadowPen']
+        cp = self.opts['pen']
  
         ## Copy pens and apply alpha adjustment
         #sp = QtGui.QPen(self.opts['shadowPen'])
@@ -129,6 +129,10 @@ class PlotDataItem(GraphicsObject):
         self.yData = None
         self.xDisp = None
         self.yDisp = None
+        self._fft = None  ## cached (x, y) spectrum of xData, yData
+        self._fftFreqs = (None, None)  ## ((n, dt), frequencies) from the last _fourierTransform
+        self._dispKey = None   ## (downsample, clip) that produced xDisp/yDisp
+        self._prevDisp = None  ## (key, xDisp, yDisp) offered for reuse by viewRangeChanged
         #self.dataMask = None
         #self.curves = []
         #self.scatters = []
@@ -455,6 +459,7 @@ class PlotDataItem(GraphicsObject):
         self.xClean = self.yClean = None
         self.xDisp = None
         self.yDisp = None
+        self._fft = None
         profiler('set data')
         
         self.updateItems()
@@ -521,7 +526,11 @@ class PlotDataItem(GraphicsObject):
                 ##y = resample(y[:len(x)*ds], len(x))  ## scipy.signal.resample causes nasty ringing
                 #y = y[::ds]
             if self.opts['fftMode']:
-                x,y = self._fourierTransform(x, y)
+                ## the spectrum only depends on the data, so keep it across
+                ## view range changes that reset xDisp/yDisp
+                if self._fft is None:
+                    self._fft = self._fourierTransform(x, y)
+                x,y = self._fft
             if self.opts['logMode'][0]:
                 x = np.log10(x)
             if self.opts['logMode'][1]:
@@ -551,6 +560,7 @@ class PlotDataItem(GraphicsObject):
                         ds = int(max(1, int((x1-x0) / (width*self.opts['autoDownsampleFactor']))))
                     ## downsampling is expensive; delay until after clipping.
             
+            clip = None
             if self.opts['clipToView']:
                 view = self.getViewBox()
                 if view is None or not view.autoRangeEnabled()[0]:
@@ -561,35 +571,48 @@ class PlotDataItem(GraphicsObject):
                         # clip to visible region extended by downsampling value
                         x0 = np.clip(int((range.left()-x[0])/dx)-1*ds , 0, len(x)-1)
                         x1 = np.clip(int((range.right()-x[0])/dx)+2*ds , 0, len(x)-1)
-                        x = x[x0:x1]
-                        y = y[x0:x1]
-                    
-            if ds > 1:
-                if self.opts['downsampleMethod'] == 'subsample':
-                    x = x[::ds]
-                    y = y[::ds]
-                elif self.opts['downsampleMethod'] == 'mean':
-                    n = len(x) // ds
-                    x = x[:n*ds:ds]
-                    y = y[:n*ds].reshape(n,ds).mean(axis=1)
-                elif self.opts['downsampleMethod'] == 'peak':
-                    n = len(x) // ds
-                    x1 = np.empty((n,2))
-                    x1[:] = x[:n*ds:ds,np.newaxis]
-                    x = x1.reshape(n*2)
-                    y1 = np.empty((n,2))
-                    y2 = y[:n*ds].reshape((n, ds))
-                    y1[:,0] = y2.max(axis=1)
-                    y1[:,1] = y2.min(axis=1)
-                    y = y1.reshape(n*2)
-                
-                    
+                        clip = (x0, x1)
+            
+            key = (ds, clip)
+            prev = self._prevDisp
+            self._prevDisp = None
+            if prev is not None and prev[0] == key:
+                x, y = prev[1], prev[2]
+            else:
+                x, y = self._clipAndDownsample(x, y, clip, ds)
+            self._dispKey = key
             self.xDisp = x
             self.yDisp = y
         #print self.yDisp.shape, self.yDisp.min(), self.yDisp.max()
         #print self.xDisp.shape, self.xDisp.min(), self.xDisp.max()
         return self.xDisp, self.yDisp
 
+    def _clipAndDownsample(self, x, y, clip, ds):
+        ## Return the displayed part of x, y: clipped to clip=(start, stop) if given, then downsampled by ds.
+        if clip is not None:
+            x = x[clip[0]:clip[1]]
+            y = y[clip[0]:clip[1]]
+                
+        if ds > 1:
+            if self.opts['downsampleMethod'] == 'subsample':
+                x = x[::ds]
+                y = y[::ds]
+            elif self.opts['downsampleMethod'] == 'mean':
+                n = len(x) // ds
+                x = x[:n*ds:ds]
+                y = y[:n*ds].reshape(n,ds).mean(axis=1)
+            elif self.opts['downsampleMethod'] == 'peak':
+                n = len(x) // ds
+                x1 = np.empty((n,2))
+                x1[:] = x[:n*ds:ds,np.newaxis]
+                x = x1.reshape(n*2)
+                y1 = np.empty((n,2))
+                y2 = y[:n*ds].reshape((n, ds))
+                y1[:,0] = y2.max(axis=1)
+                y1[:,1] = y2.min(axis=1)
+                y = y1.reshape(n*2)
+        return x, y
+
     def dataBounds(self, ax, frac=1.0, orthoRange=None):
         """
         Returns the range occupied by the data (along a specific axis) in this item.
@@ -609,7 +632,6 @@ class PlotDataItem(GraphicsObject):
                         and max)
         =============== =============================================================
         """
-        
         range = [None, None]
         if self.curve.isVisible():
             range = self.curve.dataBounds(ax, frac, orthoRange)
@@ -646,6 +668,7 @@ class PlotDataItem(GraphicsObject):
         #self.yClean = None
         self.xDisp = None
         self.yDisp = None
+        self._fft = None
         self.curve.setData([])
         self.scatter.setData([])
             
@@ -662,7 +685,15 @@ class PlotDataItem(GraphicsObject):
     def viewRangeChanged(self):
         # view range has changed; re-plot if needed
         if self.opts['clipToView'] or self.opts['autoDownsample']:
+            prev = (self._dispKey, self.xDisp, self.yDisp)
             self.xDisp = self.yDisp = None
+            if prev[1] is not None:
+                ## let getData reuse the previous result if the same samples are
+                ## still displayed (eg. only the y range changed)
+                self._prevDisp = prev
+                x, y = self.getData()
+                if x is prev[1] and y is prev[2]:
+                    return
             self.updateItems()
             
     def _fourierTransform(self, x, y):
@@ -674,10 +705,17 @@ class PlotDataItem(GraphicsObject):
             x2 = np.linspace(x[0], x[-1], len(x))
             y = np.interp(x2, x, y)
             x = x2
-        f = np.fft.fft(y) / len(y)
-        y = abs(f[1:len(f)/2])
+        ## y is real, so only the non-negative half of the spectrum is needed
+        n = len(y)
+        f = np.fft.rfft(y)
+        y = np.abs(f[1:n//2]) / n
         dt = x[-1] - x[0]
-        x = np.linspace(0, 0.5*len(x)/dt, len(y))
+        ## streaming data usually keeps the same length and sample rate, so reuse
+        ## the frequency axis when it has not changed
+        key = (len(x), dt)
+        if self._fftFreqs[0] != key:
+            self._fftFreqs = (key, np.linspace(0, 0.5*len(x)/dt, len(y)))
+        x = self._fftFreqs[1]
         return x, y
     
 def dataType(obj):
@@ -1189,12 +1189,14 @@ class ViewBox(GraphicsWidget):
         #return scale
 
     def wheelEvent(self, ev, axis=None):
-        mask = np.array(self.state['mouseEnabled'], dtype=np.float)
+        ## plain floats; this runs for every wheel event
+        mask = [float(m) for m in self.state['mouseEnabled']]
         if axis is not None and axis >= 0 and axis < len(mask):
             mv = mask[axis]
-            mask[:] = 0
+            mask = [0.0] * len(mask)
             mask[axis] = mv
-        s = ((mask * 0.02) + 1) ** (ev.delta() * self.state['wheelScaleFactor']) # actual scaling factor
+        d = ev.delta() * self.state['wheelScaleFactor']
+        s = [((m * 0.02) + 1) ** d for m in mask] # actual scaling factor
         
         center = Point(fn.invertQTransform(self.childGroup.transform()).map(ev.pos()))
         #center = ev.pos()
@@ -1231,8 +1233,9 @@ class ViewBox(GraphicsWidget):
         dif = dif * -1
 
         ## Ignore axes if mouse is disabled
-        mouseEnabled = np.array(self.state['mouseEnabled'], dtype=np.float)
-        mask = mouseEnabled.copy()
+        ## (plain floats rather than small arrays; this runs for every mouse move)
+        mouseEnabled = [float(m) for m in self.state['mouseEnabled']]
+        mask = mouseEnabled[:]
         if axis is not None:
             mask[1-axis] = 0.0
 
@@ -1252,7 +1255,7 @@ class ViewBox(GraphicsWidget):
                     ## update shape of scale box
                     self.updateScaleBox(ev.buttonDownPos(), ev.pos())
             else:
-                tr = dif*mask
+                tr = Point(dif.x()*mask[0], dif.y()*mask[1])
                 tr = self.mapToView(tr) - self.mapToView(Point(0,0))
                 x = tr.x() if mask[0] == 1 else None
                 y = tr.y() if mask[1] == 1 else None
@@ -1267,9 +1270,8 @@ class ViewBox(GraphicsWidget):
                 mask[0] = 0
             
             dif = ev.screenPos() - ev.lastScreenPos()
-            dif = np.array([dif.x(), dif.y()])
-            dif[0] *= -1
-            s = ((mask * 0.02) + 1) ** dif
+            dif = (-dif.x(), dif.y())
+            s = [((mask[i] * 0.02) + 1) ** dif[i] for i in (0, 1)]
             
             tr = self.childGroup.transform()
             tr = fn.invertQTransform(tr)
@@ -1419,19 +1421,21 @@ class ViewBox(GraphicsWidget):
         #print itemBounds
         
         ## determine tentative new range
-        range = [None, None]
+        ## (collect the edges first, then reduce each list once)
+        left, right, top, bottom = [], [], [], []
         for bounds, useX, useY, px in itemBounds:
             if useY:
-                if range[1] is not None:
-                    range[1] = [min(bounds.top(), range[1][0]), max(bounds.bottom(), range[1][1])]
-                else:
-                    range[1] = [bounds.top(), bounds.bottom()]
+                top.append(bounds.top())
+                bottom.append(bounds.bottom())
             if useX:
-                if range[0] is not None:
-                    range[0] = [min(bounds.left(), range[0][0]), max(bounds.right(), range[0][1])]
-                else:
-                    range[0] = [bounds.left(), bounds.right()]
-            profiler()
+                left.append(bounds.left())
+                right.append(bounds.right())
+        range = [None, None]
+        if len(left) > 0:
+            range[0] = [min(left), max(right)]
+        if len(top) > 0:
+            range[1] = [min(top), max(bottom)]
+        profiler()
         
         #print "range", range
         
@@ -0,0 +1,105 @@
+import numpy as np
+import pyqtgraph as pg
+
+pg.mkQApp()
+
+
+def spectrum(y):
+    n = len(y)
+    return np.abs(np.fft.fft(y)[1:n//2]) / n
+
+def test_fftCache():
+    y = np.sin(np.linspace(0, 40*np.pi, 1000))
+    pdi = pg.PlotDataItem(y, clipToView=True)
+    pdi.setFftMode(True)
+    x1, y1 = pdi.getData()
+    assert np.allclose(y1, spectrum(y))
+    fft = pdi._fft
+    assert fft is not None
+
+    # toggling fftMode and view range changes reuse the spectrum
+    pdi.setFftMode(False)
+    pdi.setFftMode(True)
+    assert pdi._fft is fft
+    pdi.viewRangeChanged()
+    pdi.getData()
+    assert pdi._fft is fft
+
+    # new data invalidates it
+    y2 = np.cos(np.linspace(0, 10*np.pi, 1000))
+    pdi.setData(y2)
+    x2, y2s = pdi.getData()
+    assert pdi._fft is not fft
+    assert np.allclose(y2s, spectrum(y2))
+    fx, fy = pdi._fourierTransform(pdi.xData, pdi.yData)
+    assert np.all(pdi._fft[0] == fx)
+    assert np.all(pdi._fft[1] == fy)
+
+    pdi.clear()
+    assert pdi._fft is None
+    assert pdi.getData() == (None, None)
+
+def test_fftFreqs():
+    pdi = pg.PlotDataItem()
+    pdi.setFftMode(True)
+
+    # same length and sample spacing: frequency axis is reused
+    pdi.setData(np.arange(1000) * 1e-3, np.random.normal(size=1000))
+    f1 = pdi.getData()[0]
+    pdi.setData(np.arange(1000) * 1e-3, np.random.normal(size=1000))
+    assert pdi.getData()[0] is f1
+
+    # length changes
+    pdi.setData(np.arange(500) * 1e-3, np.random.normal(size=500))
+    f2 = pdi.getData()[0]
+    assert f2 is not f1
+    dt = 499 * 1e-3
+    assert np.allclose(f2, np.linspace(0, 0.5*500/dt, 249))
+
+    # sample spacing changes
+    pdi.setData(np.arange(500) * 2e-3, np.random.normal(size=500))
+    f3 = pdi.getData()[0]
+    assert f3 is not f2
+    dt = 499 * 2e-3
+    assert np.allclose(f3, np.linspace(0, 0.5*500/dt, 249))
+
+def test_clipToView():
+    w = pg.PlotWidget()
+    x = np.arange(1000.)
+    pdi = pg.PlotDataItem(x, x*2)
+    w.addItem(pdi)
+    pdi.setClipToView(True)
+    w.resize(400, 300)
+    w.show()
+    pg.QtGui.QApplication.processEvents()
+    w.enableAutoRange(x=False)  ## clipToView is skipped while x auto-range is on
+
+    # range changes are applied immediately; no event loop pass is needed
+    # before the curve or dataBounds see the clipped data
+    w.setXRange(100, 200, padding=0)
+    cx, cy = pdi.curve.getData()
+    assert cx[0] <= 100 and cx[-1] >= 200 and len(cx) < 200
+    assert np.all(cy == cx*2)
+    mn, mx = pdi.dataBounds(0)
+    assert 90 <= mn <= 100 and 200 <= mx <= 210
+
+    w.setXRange(500, 600, padding=0)
+    cx, cy = pdi.curve.getData()
+    assert cx[0] <= 500 and cx[-1] >= 600 and len(cx) < 200
+
+    # changing only the y range keeps the displayed samples
+    calls = []
+    update = pdi.updateItems
+    def updateItems():
+        calls.append(1)
+        update()
+    pdi.updateItems = updateItems
+    xDisp = pdi.xDisp
+    w.setYRange(0, 10)
+    assert pdi.xDisp is xDisp
+    assert len(calls) == 0
+
+    # new data is clipped to the current range
+    pdi.setData(x, x*3)
+    cx, cy = pdi.curve.getData()
+    assert cx[0] <= 500 and cx[-1] >= 600 and np.all(cy == cx*3)
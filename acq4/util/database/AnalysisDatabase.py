@@ -59,6 +59,9 @@ class AnalysisDatabase(SqliteDatabase):
         SqliteDatabase.__init__(self, dbFile)
         self.file = dbFile
         
+        ## Keep temporary tables and sort indices in memory instead of temp files.
+        self.db.execute('PRAGMA temp_store=MEMORY')
+        
         if create:
             self.initializeDb()
             self.setBaseDir(baseDir)